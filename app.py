@@ -1,10 +1,19 @@
 import os
 import sys
+import shutil
 import threading
 import time
 import logging
-from flask import Flask, render_template, request, jsonify, send_file
+from collections import deque
+import orjson
+from flask import Flask, Response, render_template, request, jsonify, send_file, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.exceptions import ClientDisconnected
+from flask_compress import Compress
 from dotenv import load_dotenv
+from streaming_form_data import StreamingFormDataParser
+from streaming_form_data.parser import ParseFailedException
+from streaming_form_data.targets import BaseTarget, ValueTarget
 
 # Cloud Access Layer
 try:
@@ -13,17 +22,35 @@ try:
 except ImportError:
     NGROK_AVAILABLE = False
 
-from engine.trainer import LoraTrainer
-from engine.monitoring import get_hardware_status, _format_time
+# Load .env before the engine imports so module-level settings see it
+load_dotenv()
+
+from engine.worker import TrainingProcess
+from engine.monitoring import get_hardware_status, _format_time, SAMPLE_INTERVAL
 
 # ============================================================================
 # Initialization & Configuration
 # ============================================================================
-load_dotenv()
+class ORJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson (C extension) for the polled/streamed endpoints."""
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 app.config['MAX_CONTENT_LENGTH'] = 2 * 1024 * 1024 * 1024
+# Behind Apache (mod_xsendfile) or lighttpd, let the front-end server stream downloads via
+# X-Sendfile. nginx ignores this header (it needs X-Accel-Redirect), so leave it off there.
+app.config['USE_X_SENDFILE'] = os.getenv("USE_X_SENDFILE", "0") == "1"
+# Gzip JSON/HTML/static responses above 500 bytes; the /events stream and zip downloads are left as-is
+app.config['COMPRESS_MIN_SIZE'] = 500
+Compress(app)
 
-# Silence INFO logs for cleaner terminal
+# Configure logging once for the whole app, then silence INFO logs for cleaner terminal
+logging.basicConfig(level=logging.INFO)
 log = logging.getLogger('werkzeug')
 log.setLevel(logging.WARNING)
 pyngrok_logger = logging.getLogger('pyngrok')
@@ -41,13 +68,42 @@ os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 os.makedirs(TEMP_FOLDER, exist_ok=True)
 os.environ["HF_HOME"] = os.path.abspath(TEMP_FOLDER)
 
+# Read size for streamed uploads (same buffer size coreutils `cp` uses)
+UPLOAD_CHUNK_SIZE = 128 * 1024
+
 # ============================================================================
 # Global State Management
 # ============================================================================
+# Bounded log ring buffer; appends from the trainer thread are O(1) and atomic
+LOG_BUFFER_SIZE = 5000
+# Number of trailing log lines returned by /status (and on /events connect)
+STATUS_LOG_TAIL = 200
+# Max seconds an /events stream waits for a change before re-checking state
+EVENT_TIMEOUT = 1.0
+# Seconds between hardware telemetry pushes on /events; one push per background sample
+HARDWARE_EVENT_INTERVAL = SAMPLE_INTERVAL
+
+class LogBuffer(deque):
+    """Bounded log ring buffer that also counts every line ever appended."""
+    def __init__(self, lines=()):
+        super().__init__(lines, maxlen=LOG_BUFFER_SIZE)
+        self.total = len(self)
+
+    def append(self, line):
+        super().append(line)
+        self.total += 1
+
+def new_log_buffer(*lines):
+    return LogBuffer(lines)
+
+# Guards multi-key updates and the snapshots served to the UI
+STATE_LOCK = threading.RLock()
+# Signaled whenever the state changes so /events streams can push a delta
+STATE_CHANGED = threading.Condition(STATE_LOCK)
 TRAINING_STATE = {
     "status": "IDLE",
     "progress": 0,
-    "logs": [],
+    "logs": new_log_buffer(),
     "start_time": None,
     "duration": "00:00",
     "etr": "--:--",
@@ -57,20 +113,52 @@ TRAINING_STATE = {
     "val_metrics": None
 }
 trainer_thread = None
+training_process = None
+
+def notify_state_changed():
+    """Wakes up every /events stream waiting for a state change."""
+    with STATE_CHANGED:
+        STATE_CHANGED.notify_all()
+
+def push_log(msg):
+    """Appends a line to the shared training log."""
+    with STATE_CHANGED:
+        TRAINING_STATE["logs"].append(msg)
+        STATE_CHANGED.notify_all()
+
+def get_state_snapshot():
+    """Returns a shallow copy of the state with only the trailing log lines."""
+    with STATE_LOCK:
+        logs = list(TRAINING_STATE["logs"])[-STATUS_LOG_TAIL:]
+        return {**TRAINING_STATE, "logs": logs}
 
 # ============================================================================
 # Trainer Lifecycle Wrapper
 # ============================================================================
-def run_training_lifecycle(trainer_instance):
-    """Wrapper to manage state changes around the trainer's run method."""
+def run_training_lifecycle(process):
+    """Wrapper to manage state changes around the trainer subprocess."""
+    exit_code = None
+    started = time.monotonic()
     try:
-        trainer_instance.run()
+        process.start()
+        exit_code = process.wait()
     finally:
         # This block runs whether training succeeds, fails, or is interrupted
-        if TRAINING_STATE.get("start_time"):
-            final_duration = time.time() - TRAINING_STATE["start_time"]
-            TRAINING_STATE["duration"] = _format_time(final_duration)
-            TRAINING_STATE["etr"] = "--:--"
+        with STATE_CHANGED:
+            # Only finalize the state if no newer run has taken it over
+            if process is training_process:
+                if TRAINING_STATE["status"] == "TRAINING":
+                    # The subprocess died without reporting an outcome (killed, OOM, crash)
+                    if TRAINING_STATE["stop_signal"]:
+                        TRAINING_STATE["status"] = "INTERRUPTED"
+                    else:
+                        TRAINING_STATE["status"] = "ERROR"
+                        TRAINING_STATE["error_msg"] = f"Trainer process exited unexpectedly (code {exit_code})"
+                    TRAINING_STATE["logs"].append(f"System: Trainer process exited with code {exit_code}.")
+                # start_time stays wall-clock for the browser; the final duration uses the monotonic clock
+                TRAINING_STATE["duration"] = _format_time(time.monotonic() - started)
+                TRAINING_STATE["etr"] = "--:--"
+                STATE_CHANGED.notify_all()
 
 # ============================================================================
 # Routes & Logic
@@ -88,27 +176,98 @@ def get_files_in_directory(directory):
         if f.endswith(".jsonl") or f.endswith(".json")
     ])
 
+class DatasetFileTarget(BaseTarget):
+    """
+    Streaming form-data target that writes each uploaded file straight to disk.
+    The destination folder is resolved when each file part starts, so the
+    'type' field only needs to be known by then. Each part is written to a hidden
+    temporary name and only renamed into place once the part is complete.
+    """
+    def __init__(self, folder_resolver):
+        super().__init__()
+        self.folder_resolver = folder_resolver
+        self.received = 0
+        self.in_part = False
+        self._fh = None
+        self._tmp_path = None
+        self._final_path = None
+
+    def on_start(self):
+        self.received += 1
+        self.in_part = True
+        filename = os.path.basename(self.multipart_filename or "")
+        if filename.endswith(".jsonl") or filename.endswith(".json"):
+            folder = self.folder_resolver()
+            self._final_path = os.path.join(folder, filename)
+            self._tmp_path = os.path.join(folder, f".{filename}.part")
+            self._fh = open(self._tmp_path, "wb")
+
+    def on_data_received(self, chunk):
+        if self._fh:
+            self._fh.write(chunk)
+
+    def on_finish(self):
+        self.in_part = False
+        if self._fh:
+            self._fh.close()
+            os.replace(self._tmp_path, self._final_path)
+            self._fh = self._tmp_path = self._final_path = None
+
+    def abort(self):
+        """Discards the part currently being written (truncated or malformed body)."""
+        self.in_part = False
+        if self._fh:
+            self._fh.close()
+            try:
+                os.remove(self._tmp_path)
+            except OSError:
+                pass
+            self._fh = self._tmp_path = self._final_path = None
+
 @app.route("/upload", methods=["POST"])
 def upload_files():
     """
     Handles file uploads for training and validation sets.
     Additive upload logic: Saves files without deleting existing ones.
+    The multipart body is parsed as it streams in, so files are never buffered in memory.
     Returns the complete list of files in the directory.
     """
-    if "files" not in request.files:
+    type_target = ValueTarget()
+
+    def resolve_dataset_type():
+        return request.args.get("type") or type_target.value.decode() or "train"
+
+    def resolve_target_folder():
+        return UPLOAD_FOLDER_VAL if resolve_dataset_type() == "val" else UPLOAD_FOLDER_TRAIN
+
+    file_target = DatasetFileTarget(resolve_target_folder)
+    try:
+        parser = StreamingFormDataParser(headers=request.headers)
+        parser.register("type", type_target)
+        parser.register("files", file_target)
+        while True:
+            chunk = request.stream.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            parser.data_received(chunk)
+    except (ParseFailedException, ClientDisconnected) as e:
+        file_target.abort()
+        return jsonify({"error": f"Malformed upload: {e}"}), 400
+    except Exception:
+        file_target.abort()
+        raise
+
+    if file_target.in_part:
+        # Body ended before the closing boundary (e.g. the client aborted)
+        file_target.abort()
+        return jsonify({"error": "Upload incomplete"}), 400
+
+    if file_target.received == 0:
         return jsonify({"error": "No files provided"}), 400
     
-    dataset_type = request.form.get("type", "train")
-    target_folder = UPLOAD_FOLDER_VAL if dataset_type == "val" else UPLOAD_FOLDER_TRAIN
-    
-    # Save new files
-    for file in request.files.getlist("files"):
-        if file.filename and (file.filename.endswith(".jsonl") or file.filename.endswith(".json")):
-            filepath = os.path.join(target_folder, file.filename)
-            file.save(filepath)
-    
     # Scan directory for authoritative state
-    current_files = get_files_in_directory(target_folder)
+    dataset_type = resolve_dataset_type()
+    current_files = get_files_in_directory(resolve_target_folder())
     
     return jsonify({
         "count": len(current_files), 
@@ -148,52 +307,131 @@ def delete_file():
 
 @app.route("/train", methods=["POST"])
 def start_training():
-    global trainer_thread
-    if TRAINING_STATE["status"] == "TRAINING":
-        return jsonify({"error": "Training already in progress"}), 400
-    
+    global trainer_thread, training_process
     config = request.json
-    TRAINING_STATE.update({
-        "status": "TRAINING",
-        "progress": 0,
-        "logs": ["Initializing training environment..."],
-        "start_time": time.time(),
-        "duration": "00:00",
-        "etr": "--:--",
-        "output_zip": None,
-        "error_msg": None,
-        "stop_signal": False,
-        "val_metrics": None
-    })
-    
-    trainer = LoraTrainer(
-        base_model=config.get("base_model"),
-        dataset_folder_train=UPLOAD_FOLDER_TRAIN,
-        dataset_folder_val=UPLOAD_FOLDER_VAL,
-        output_folder=OUTPUT_FOLDER,
-        epochs=int(config.get("epochs", 3)),
-        batch_size=int(config.get("batch_size", 1)),
-        learning_rate=float(config.get("lr", 2e-4)),
-        use_thinking=config.get("use_thinking", False),
-        state_ref=TRAINING_STATE,
-        temp_folder=TEMP_FOLDER,
-    )
-    
-    trainer_thread = threading.Thread(target=run_training_lifecycle, args=(trainer,), daemon=False)
+    with STATE_LOCK:
+        if TRAINING_STATE["status"] == "TRAINING":
+            return jsonify({"error": "Training already in progress"}), 400
+        if training_process is not None and training_process.is_alive():
+            # The previous run reports FINISHED before validating, saving and zipping
+            return jsonify({"error": "Previous run is still saving its results"}), 400
+
+        TRAINING_STATE.update({
+            "status": "TRAINING",
+            "progress": 0,
+            "logs": new_log_buffer("Initializing training environment..."),
+            "start_time": time.time(),
+            "duration": "00:00",
+            "etr": "--:--",
+            "output_zip": None,
+            "error_msg": None,
+            "stop_signal": False,
+            "val_metrics": None
+        })
+        STATE_CHANGED.notify_all()
+
+        trainer_kwargs = dict(
+            base_model=config.get("base_model"),
+            dataset_folder_train=UPLOAD_FOLDER_TRAIN,
+            dataset_folder_val=UPLOAD_FOLDER_VAL,
+            output_folder=OUTPUT_FOLDER,
+            epochs=int(config.get("epochs", 3)),
+            batch_size=int(config.get("batch_size", 1)),
+            learning_rate=float(config.get("lr", 2e-4)),
+            use_thinking=config.get("use_thinking", False),
+            temp_folder=TEMP_FOLDER,
+        )
+        # Training runs in its own process; the lifecycle thread only mirrors its state updates
+        process = TrainingProcess(
+            trainer_kwargs, TRAINING_STATE, STATE_LOCK,
+            on_update=notify_state_changed,
+            owns_state=lambda: training_process is process,
+        )
+        training_process = process
+
+    trainer_thread = threading.Thread(target=run_training_lifecycle, args=(training_process,), daemon=False)
     trainer_thread.start()
     
     return jsonify({"status": "started"})
 
 @app.route("/stop", methods=["POST"])
 def stop_training():
-    if TRAINING_STATE["status"] == "TRAINING":
-        TRAINING_STATE["stop_signal"] = True
-        return jsonify({"status": "stopping"})
+    with STATE_LOCK:
+        if TRAINING_STATE["status"] == "TRAINING":
+            if TRAINING_STATE["stop_signal"] and training_process:
+                # A second stop request means the trainer did not respond; kill it
+                training_process.terminate()
+                return jsonify({"status": "terminating"})
+            TRAINING_STATE["stop_signal"] = True
+            if training_process:
+                training_process.request_stop()
+            return jsonify({"status": "stopping"})
     return jsonify({"status": "ignored", "message": "Not currently training"})
 
 @app.route("/status")
 def get_status():
-    return jsonify(TRAINING_STATE)
+    # Serialize a snapshot so jsonify never iterates state the trainer is mutating
+    response = jsonify(get_state_snapshot())
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+@app.route("/events")
+def stream_events():
+    """
+    Server-Sent Events stream of training state.
+    Each event carries only what changed since the previous one: modified state keys,
+    newly appended log lines, and hardware telemetry every HARDWARE_EVENT_INTERVAL seconds.
+    """
+    def generate():
+        sent_state = {}
+        log_buffer, log_total = None, 0
+        next_hardware_push = 0.0
+
+        while True:
+            event = {}
+            with STATE_LOCK:
+                logs = TRAINING_STATE["logs"]
+                if logs is not log_buffer or logs.total < log_total:
+                    # First event or buffer replaced (new run/reset): resend the tail
+                    event["logs_reset"] = True
+                    new_lines = list(logs)[-STATUS_LOG_TAIL:]
+                else:
+                    new_count = min(logs.total - log_total, STATUS_LOG_TAIL)
+                    new_lines = list(logs)[-new_count:] if new_count > 0 else []
+                log_buffer, log_total = logs, logs.total
+
+                state_delta = {
+                    k: v for k, v in TRAINING_STATE.items()
+                    if k != "logs" and (k not in sent_state or sent_state[k] != v)
+                }
+                sent_state.update(state_delta)
+
+            if new_lines:
+                event["logs"] = new_lines
+            if state_delta:
+                event["state"] = state_delta
+
+            now = time.monotonic()
+            if now >= next_hardware_push:
+                event["hardware"] = get_hardware_status()
+                next_hardware_push = now + HARDWARE_EVENT_INTERVAL
+
+            if event:
+                yield f"data: {app.json.dumps(event)}\n\n"
+            else:
+                # Comment line keeps proxies from closing an idle connection
+                yield ": keep-alive\n\n"
+
+            # Wake up in time for the next hardware push even if the state stays idle
+            timeout = min(EVENT_TIMEOUT, max(0.0, next_hardware_push - time.monotonic()))
+            with STATE_CHANGED:
+                STATE_CHANGED.wait(timeout=timeout)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.route("/hardware-status")
 def hardware_status():
@@ -203,22 +441,35 @@ def hardware_status():
 def download_lora():
     zip_path = TRAINING_STATE.get("output_zip")
     if zip_path and os.path.exists(zip_path):
-        return send_file(zip_path, as_attachment=True)
+        # Conditional/range responses let clients resume; Werkzeug sets Content-Length from the file
+        return send_file(os.path.abspath(zip_path), as_attachment=True, conditional=True, etag=True)
     return jsonify({"error": "File not found."}), 404
 
 @app.route("/reset", methods=["POST"])
 def reset():
-    TRAINING_STATE.update({
-        "status": "IDLE", "progress": 0, "logs": [], "output_zip": None,
-        "error_msg": None, "etr": "--:--", "duration": "00:00",
-        "stop_signal": False, "val_metrics": None
-    })
+    with STATE_LOCK:
+        TRAINING_STATE.update({
+            "status": "IDLE", "progress": 0, "logs": new_log_buffer(), "output_zip": None,
+            "error_msg": None, "etr": "--:--", "duration": "00:00",
+            "stop_signal": False, "val_metrics": None
+        })
+        STATE_CHANGED.notify_all()
+    # Drop and recreate the folders instead of unlinking files one by one
     for folder in [UPLOAD_FOLDER_TRAIN, UPLOAD_FOLDER_VAL]:
-        if os.path.exists(folder):
-            for f in os.listdir(folder):
-                try:
-                    os.remove(os.path.join(folder, f))
-                except Exception: pass
+        shutil.rmtree(folder, ignore_errors=True)
+        os.makedirs(folder, exist_ok=True)
+    # Preprocessed dataset caches are keyed by the uploads just removed; keep them while
+    # a run is still alive, since it may be reading or writing one
+    if training_process is None or not training_process.is_alive():
+        for entry in os.scandir(TEMP_FOLDER):
+            if entry.name.startswith("prep_"):
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                else:
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        pass
     return jsonify({"status": "reset"})
 
 # ============================================================================
@@ -228,16 +479,17 @@ def init_ngrok(port):
     token = os.getenv("NGROK_AUTHTOKEN")
     if not token or not NGROK_AVAILABLE: return
 
-    if os.environ.get("WERKZEUG_RUN_MAIN") != "true":
-        try:
-            conf.get_default().auth_token = token
-            public_url = ngrok.connect(port).public_url
-            print("\n" + "="*60 + f"\n🚀 PUBLIC CLOUD ACCESS ENABLED\n🔗 ACCESS UI HERE: {public_url}\n" + "="*60 + "\n")
-            TRAINING_STATE["logs"].append(f"System: Remote access enabled at {public_url}")
-        except Exception as e:
-            print(f"\n[DEPLOY] Failed to start ngrok tunnel: {e}")
+    try:
+        conf.get_default().auth_token = token
+        public_url = ngrok.connect(port).public_url
+        print("\n" + "="*60 + f"\n🚀 PUBLIC CLOUD ACCESS ENABLED\n🔗 ACCESS UI HERE: {public_url}\n" + "="*60 + "\n")
+        push_log(f"System: Remote access enabled at {public_url}")
+    except Exception as e:
+        print(f"\n[DEPLOY] Failed to start ngrok tunnel: {e}")
 
 if __name__ == "__main__":
     port = int(os.getenv("PORT", "5001"))
+    # The reloader would fork a second process (double NVML init, double tunnel); keep it off
+    debug = os.getenv("FLASK_DEBUG", "0").lower() in ("1", "true")
     init_ngrok(port)
-    app.run(debug=True, port=port, host="0.0.0.0")
\ No newline at end of file
+    app.run(debug=debug, use_reloader=False, port=port, host="0.0.0.0", threaded=True)
\ No newline at end of file
@@ -1,7 +1,17 @@
 import os
+import torch
 from peft import LoraConfig, TaskType
 from trl import SFTConfig
 
+def get_compute_dtype() -> torch.dtype:
+    """
+    Returns the training compute dtype: bfloat16 on GPUs with native support
+    (Ampere and newer), float16 otherwise.
+    """
+    if torch.cuda.is_available() and torch.cuda.is_bf16_supported():
+        return torch.bfloat16
+    return torch.float16
+
 def get_lora_config() -> LoraConfig:
     """
     Generates the specific LoRA configuration for Qwen3-VL fine-tuning.
@@ -49,6 +59,7 @@ def get_training_args(
     """
     output_dir = os.path.join(output_folder, run_name)
     os.makedirs(output_dir, exist_ok=True)
+    use_bf16 = get_compute_dtype() == torch.bfloat16
 
     return SFTConfig(
         output_dir=output_dir,
@@ -58,7 +69,7 @@ def get_training_args(
         learning_rate=learning_rate,
         num_train_epochs=epochs,
         fp16=False,  # Qwen3-VL preference
-        bf16=False,
+        bf16=use_bf16,  # Matches the 4-bit compute dtype on Ampere+
         # Log every step to enable granular ETR calculation and frontend updates
         logging_steps=1,
         save_strategy="no",
@@ -70,4 +81,7 @@ def get_training_args(
         max_length=None,
         packing=False,
         remove_unused_columns=False,
+        # Collated batches are pinned, so host-to-device copies can run asynchronously
+        dataloader_pin_memory=True,
+        accelerator_config={"non_blocking": True},
     )
\ No newline at end of file
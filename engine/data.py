@@ -1,49 +1,62 @@
 import os
-import base64
+import mmap
+import shutil
+import binascii
+import orjson
+import xxhash
 import torch
+from torch.nn.utils.rnn import pad_sequence
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from PIL import Image
 from datasets import load_dataset, Dataset as HFDataset, concatenate_datasets
 
+# Files up to this size are parsed with orjson; larger ones use the Arrow JSON reader
+ORJSON_MAX_FILE_BYTES = 1024 ** 3
+# Rows per batch for the vectorized dataset transform/filter passes
+MAP_BATCH_SIZE = 1000
+# Worker processes for map/filter; only used when a file spans several batches
+MAP_NUM_PROC = max(1, (os.cpu_count() or 2) // 2)
+# Rows per batch (and per Arrow write) for processor preprocessing; pixel values are large
+PREPROCESS_BATCH_SIZE = 16
+# Worker processes for processor preprocessing; PIL and tokenizers release the GIL in native code
+PREPROCESS_NUM_PROC = os.cpu_count() or 1
+# Threads used by the collator when samples are processed on the fly
+COLLATOR_MAX_WORKERS = min(8, os.cpu_count() or 1)
+# Max rendered chat templates kept by the collator across epochs
+TEMPLATE_CACHE_SIZE = 4096
+
+# Page-locked batches let the host-to-device copy overlap with compute
+PIN_MEMORY = torch.cuda.is_available()
+
+def _pin(tensor: torch.Tensor) -> torch.Tensor:
+    """Moves a collated CPU tensor to pinned memory when a GPU is present."""
+    return tensor.pin_memory() if PIN_MEMORY else tensor
+
 def base64_to_pil(base64_str: str) -> Image.Image:
-    """Convert base64 data URI or raw string to PIL Image."""
+    """
+    Convert base64 data URI or raw string to PIL Image.
+    """
     try:
         if base64_str.startswith("data:"):
-            base64_str = base64_str.split(",", 1)[1]
-        image_data = base64.b64decode(base64_str)
-        return Image.open(BytesIO(image_data)).convert("RGB")
+            base64_str = base64_str.partition(",")[2]
+        image_data = binascii.a2b_base64(base64_str)
+        image = Image.open(BytesIO(image_data))
+        image.load()
+        return image.convert("RGB")
     except Exception as e:
         raise ValueError(f"Failed to decode base64 image: {e}")
 
-def extract_text_and_images(messages):
-    """
-    Extract text and images from message format for validation.
-    """
-    text_parts = []
-    images = []
-    
-    for msg in messages:
-        content = msg.get("content", [])
-        if not isinstance(content, list):
-            continue
-        
-        for item in content:
-            if isinstance(item, dict):
-                if item.get("type") == "text":
-                    text = item.get("text", "")
-                    if text:
-                        text_parts.append(text)
-                elif item.get("type") == "image":
-                    image_data = item.get("image", "")
-                    if isinstance(image_data, str):
-                        try:
-                            pil_image = base64_to_pil(image_data)
-                            images.append(pil_image)
-                        except Exception:
-                            pass
-    
-    text = " ".join(text_parts) if text_parts else ""
-    return text, images
+def _decode_image_item(item):
+    """Returns the decoded PIL image of an image content item, or None if undecodable."""
+    image_data = item.get("image", "")
+    if isinstance(image_data, str):
+        try:
+            return base64_to_pil(image_data)
+        except Exception:
+            pass
+    return None
 
 def validate_sample(sample):
     """Validate that a sample has the required structure."""
@@ -58,16 +71,50 @@ def validate_sample(sample):
     return False
 
 def collect_data_files(dataset_folder: str):
-    """Scan folder for JSONL or JSON files."""
-    files = []
-    if not os.path.exists(dataset_folder):
-        return files
-        
-    for f in os.listdir(dataset_folder):
-        if f.endswith(".jsonl") or f.endswith(".json"):
-            files.append(os.path.join(dataset_folder, f))
+    """
+    Scan folder for JSONL or JSON files in a single pass (symlinks are followed).
+    Returns (path, size) pairs sorted largest first, so the longest loads start earliest.
+    """
+    try:
+        with os.scandir(dataset_folder) as it:
+            files = [
+                (e.path, e.stat().st_size) for e in it
+                if (e.name.endswith(".jsonl") or e.name.endswith(".json")) and e.is_file()
+            ]
+    except FileNotFoundError:
+        return []
+    
+    files.sort(key=lambda f: f[1], reverse=True)
     return files
 
+def read_json_records(file_path: str):
+    """
+    Parses a JSONL file (or a JSON array file) into a list of row dicts with orjson.
+    This skips the Arrow JSON reader's struct inference, which is slow for chat-shaped rows.
+    """
+    with open(file_path, "rb") as f:
+        if file_path.endswith(".json"):
+            raw = f.read()
+            try:
+                payload = orjson.loads(raw)
+                return payload if isinstance(payload, list) else [payload]
+            except orjson.JSONDecodeError:
+                pass  # JSON Lines content saved with a .json extension
+            return [orjson.loads(line) for line in raw.splitlines() if line.strip()]
+        # Parsed line by line, so the raw text is never held alongside the records
+        return [orjson.loads(line) for line in f if line.strip()]
+
+def records_to_dataset(records):
+    """
+    Builds an in-memory Dataset from row dicts with a column for every key seen in any row.
+    (`Dataset.from_list` only uses the first row's keys, silently dropping the rest.)
+    Rows missing a key get None, matching the Arrow JSON reader.
+    """
+    keys = {}
+    for record in records:
+        keys.update(dict.fromkeys(record))
+    return HFDataset.from_dict({k: [r.get(k) for r in records] for k in keys})
+
 def transform_reasoning_sample(sample, use_thinking: bool):
     """
     Transforms a sample by merging 'thinking' and 'response' fields into the messages list.
@@ -110,12 +157,32 @@ def transform_reasoning_sample(sample, use_thinking: bool):
     
     return {"messages": new_messages}
 
+def transform_reasoning_batch(batch, use_thinking: bool):
+    """Batched variant of transform_reasoning_sample for `Dataset.map(batched=True)`."""
+    messages = batch["messages"]
+    responses = batch["response"] if "response" in batch else None
+    thinkings = batch["thinking"] if "thinking" in batch else None
+
+    transformed = []
+    for i, msgs in enumerate(messages):
+        sample = {"messages": msgs}
+        if responses is not None:
+            sample["response"] = responses[i]
+        if thinkings is not None:
+            sample["thinking"] = thinkings[i]
+        transformed.append(transform_reasoning_sample(sample, use_thinking).get("messages"))
+    return {"messages": transformed}
+
+def validate_batch(batch):
+    """Batched variant of validate_sample for `Dataset.filter(batched=True)`."""
+    return [validate_sample({"messages": msgs}) for msgs in batch["messages"]]
+
 def load_and_prepare_dataset(dataset_folder: str, allow_empty: bool = False, use_thinking: bool = False):
     """
     Loads, transforms, validates, and prepares the dataset from the folder.
     
     Refactored to handle heterogeneous schemas:
-    1. Loads files individually to isolate schema issues.
+    1. Loads files individually to isolate schema issues (parsed with orjson).
     2. Applies transformation.
     3. Prunes extraneous columns (like auxiliary metadata) immediately.
     4. Concatenates all valid partial datasets into a final one.
@@ -130,25 +197,37 @@ def load_and_prepare_dataset(dataset_folder: str, allow_empty: bool = False, use
     
     print(f"[DataEngine] Found {len(data_files)} files. Loading iteratively...")
 
-    for file_path in data_files:
+    for file_path, file_size in data_files:
         try:
-            # Load individual file
-            # We assume split="train" because load_dataset returns a DatasetDict otherwise
-            ds = load_dataset("json", data_files=file_path, split="train", streaming=False)
+            # Load individual file; very large files go through the Arrow reader to bound memory
+            if file_size <= ORJSON_MAX_FILE_BYTES:
+                ds = records_to_dataset(read_json_records(file_path))
+            else:
+                # We assume split="train" because load_dataset returns a DatasetDict otherwise
+                ds = load_dataset("json", data_files=file_path, split="train", streaming=False)
+
+            if "messages" not in ds.column_names:
+                print(f"⚠️ Skipping {os.path.basename(file_path)}: 'messages' column missing.")
+                continue
+
+            # Spawning workers only pays off once a file spans several batches
+            num_proc = MAP_NUM_PROC if len(ds) > MAP_BATCH_SIZE else None
             
-            # 1. Transform logic
-            ds = ds.map(lambda x: transform_reasoning_sample(x, use_thinking))
+            # 1. Transform logic (vectorized over batches of rows)
+            ds = ds.map(
+                transform_reasoning_batch,
+                fn_kwargs={"use_thinking": use_thinking},
+                batched=True,
+                batch_size=MAP_BATCH_SIZE,
+                num_proc=num_proc,
+            )
             
             # 2. Validate
-            ds = ds.filter(validate_sample)
+            ds = ds.filter(validate_batch, batched=True, batch_size=MAP_BATCH_SIZE, num_proc=num_proc)
             
-            # 3. Standardize Schema: Keep ONLY 'messages'
+            # 3. Standardize Schema: Keep ONLY 'messages' (zero-copy over Arrow)
             # This prevents schema conflicts when concatenating files with different extra columns
-            if "messages" in ds.column_names:
-                ds = ds.select_columns(["messages"])
-            else:
-                print(f"⚠️ Skipping {os.path.basename(file_path)}: 'messages' column missing.")
-                continue
+            ds = ds.select_columns(["messages"])
 
             if len(ds) > 0:
                 valid_datasets.append(ds)
@@ -173,6 +252,224 @@ def load_and_prepare_dataset(dataset_folder: str, allow_empty: bool = False, use
     print(f"[DataEngine] Successfully aggregated {len(final_dataset)} samples.")
     return final_dataset
 
+def _chat_text(item, chat_content, images):
+    text = item.get("text", "")
+    chat_content.append({"type": "text", "text": text})
+    return bool(text)
+
+def _chat_image(item, chat_content, images):
+    pil_image = _decode_image_item(item)
+    if pil_image is not None:
+        chat_content.append({"type": "image", "image": pil_image})
+        images.append(pil_image)
+    return False
+
+# Chat content builders, dispatched on item["type"]; each returns whether it added text
+CHAT_HANDLERS = {"text": _chat_text, "image": _chat_image}
+
+def _template_key(chat_messages):
+    """Hashes the text tree of a conversation; images only contribute their position."""
+    return hash(tuple(
+        (msg["role"], tuple((item["type"], item.get("text", "")) for item in msg["content"]))
+        for msg in chat_messages
+    ))
+
+def build_model_inputs(messages, processor, template_cache=None):
+    """
+    Decodes images, applies the chat template and runs the processor for one sample.
+    Returns the processor output (input_ids, attention_mask, pixel_values, image_grid_thw).
+
+    If `template_cache` (an OrderedDict) is given, rendered templates are reused for
+    conversations with the same text, so repeated epochs skip apply_chat_template.
+    """
+    # Build chat messages for processor, decoding each image exactly once
+    chat_messages = []
+    images = []
+    has_text = False
+    for msg in messages:
+        chat_msg = {"role": msg.get("role", "user"), "content": []}
+        content = msg.get("content", [])
+        if not isinstance(content, list):
+            continue
+        
+        for item in content:
+            handler = CHAT_HANDLERS.get(item.get("type")) if type(item) is dict else None
+            if handler:
+                has_text |= handler(item, chat_msg["content"], images)
+        
+        if chat_msg["content"]:
+            chat_messages.append(chat_msg)
+    
+    if not has_text:
+        raise ValueError("No text content in sample")
+    if not images:
+        raise ValueError("No images in sample")
+    if not chat_messages:
+        raise ValueError("No valid chat messages after processing")
+    
+    cache_key = _template_key(chat_messages) if template_cache is not None else None
+    text_with_template = template_cache.get(cache_key) if template_cache is not None else None
+    if text_with_template is None:
+        text_with_template = processor.apply_chat_template(
+            chat_messages,
+            tokenize=False,
+            add_generation_prompt=False,
+        )
+        if template_cache is not None:
+            if len(template_cache) >= TEMPLATE_CACHE_SIZE:
+                template_cache.popitem(last=False)
+            template_cache[cache_key] = text_with_template
+    
+    processed = processor(
+        text=text_with_template,
+        images=images,
+        return_tensors="pt",
+    )
+    
+    return processed
+
+def preprocess_batch(batch, processor, template_cache=None):
+    """
+    Batched `Dataset.map` function that turns raw `messages` rows into model inputs.
+    Samples that fail to process are dropped from the output.
+    `template_cache` is passed through to build_model_inputs and shared across batches.
+    """
+    output = {"input_ids": [], "attention_mask": [], "pixel_values": [], "image_grid_thw": []}
+    for messages in batch["messages"]:
+        try:
+            processed = build_model_inputs(messages, processor, template_cache)
+        except Exception:
+            continue
+
+        input_ids = processed.get("input_ids")
+        if input_ids is None or input_ids.numel() == 0:
+            continue
+        attention_mask = processed.get("attention_mask")
+        if attention_mask is None or attention_mask.shape != input_ids.shape:
+            attention_mask = torch.ones_like(input_ids)
+
+        output["input_ids"].append(input_ids.view(-1).tolist())
+        output["attention_mask"].append(attention_mask.view(-1).tolist())
+        output["pixel_values"].append(processed["pixel_values"].numpy())
+        output["image_grid_thw"].append(processed["image_grid_thw"].tolist())
+    return output
+
+def preprocess_dataset(dataset, processor, cache_file_name: str):
+    """
+    Runs image decoding and the processor once over the whole dataset, ahead of training.
+    The results are written as Arrow shards at `cache_file_name` (memory-mapped, not held
+    in RAM), so every epoch reuses them and the collator only has to pad and stack tensors.
+    """
+    num_proc = PREPROCESS_NUM_PROC if len(dataset) > MAP_BATCH_SIZE else None
+
+    processed = dataset.map(
+        preprocess_batch,
+        # Each map worker gets its own copy of the cache and reuses it for all of its batches
+        fn_kwargs={"processor": processor, "template_cache": OrderedDict()},
+        batched=True,
+        batch_size=PREPROCESS_BATCH_SIZE,
+        writer_batch_size=PREPROCESS_BATCH_SIZE,
+        num_proc=num_proc,
+        remove_columns=dataset.column_names,
+        cache_file_name=cache_file_name,
+        load_from_cache_file=False,
+    )
+    print(f"[DataEngine] Preprocessed {len(processed)}/{len(dataset)} samples.")
+    return processed.with_format("torch")
+
+def fingerprint_files(paths, *extra) -> str:
+    """
+    Content hash of the given files (plus any extra settings) using xxh3 over mmap,
+    so large shards are hashed straight from the page cache.
+    """
+    h = xxhash.xxh3_64()
+    for item in extra:
+        h.update(repr(item).encode("utf-8"))
+    for path in sorted(paths):
+        h.update(os.path.basename(path).encode("utf-8"))
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                continue
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                h.update(mm)
+    return h.hexdigest()
+
+def prune_preprocessed_caches(cache_folder: str, prefix: str = "prep_"):
+    """Removes cache directories, partial saves and map shards in `cache_folder` named `prefix*`."""
+    if not os.path.isdir(cache_folder):
+        return
+    for entry in os.scandir(cache_folder):
+        if not entry.name.startswith(prefix):
+            continue
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path)
+            else:
+                os.remove(entry.path)
+        except OSError:
+            pass  # Still memory-mapped elsewhere (Windows); retried on the next prune
+
+def load_preprocessed_dataset(
+    dataset_folder: str,
+    processor,
+    cache_folder: str,
+    allow_empty: bool = False,
+    use_thinking: bool = False,
+):
+    """
+    Loads, prepares and preprocesses the dataset in `dataset_folder`.
+    The result is saved under `cache_folder`, keyed by the files' content fingerprint,
+    so later runs on unchanged files skip all transform/filter/processor work.
+    Only the latest cache per dataset folder is kept.
+    """
+    data_files = collect_data_files(dataset_folder)
+    if not data_files:
+        return load_and_prepare_dataset(dataset_folder, allow_empty=allow_empty, use_thinking=use_thinking)
+
+    tokenizer = getattr(processor, "tokenizer", processor)
+    processor_id = getattr(tokenizer, "name_or_path", type(processor).__name__)
+    fingerprint = fingerprint_files([path for path, _ in data_files], use_thinking, processor_id)
+    # Every entry for this folder (cache, partial save, map shards) shares the prefix
+    folder_key = xxhash.xxh3_64_hexdigest(os.path.abspath(dataset_folder).encode("utf-8"))[:8]
+    folder_prefix = f"prep_{folder_key}_"
+    cache_path = os.path.join(cache_folder, f"{folder_prefix}{fingerprint}")
+    # state.json is written last by save_to_disk, so its presence marks a complete cache
+    if os.path.isfile(os.path.join(cache_path, "state.json")):
+        print(f"[DataEngine] Reusing preprocessed dataset from {cache_path}")
+        return HFDataset.load_from_disk(cache_path)
+
+    # Superseded caches and leftovers of failed runs for this folder
+    prune_preprocessed_caches(cache_folder, folder_prefix)
+
+    dataset = load_and_prepare_dataset(dataset_folder, allow_empty=allow_empty, use_thinking=use_thinking)
+    if dataset is None:
+        return None
+
+    os.makedirs(cache_folder, exist_ok=True)
+    try:
+        processed = preprocess_dataset(dataset, processor, cache_file_name=f"{cache_path}.arrow")
+        if len(processed) == 0:
+            return processed
+
+        # Save under a temporary name and rename, so an interrupted run never leaves a
+        # half-written directory behind that later runs would try to load
+        tmp_path = f"{cache_path}.tmp"
+        processed.save_to_disk(tmp_path)
+        os.replace(tmp_path, cache_path)
+    except BaseException:
+        prune_preprocessed_caches(cache_folder, folder_prefix)
+        raise
+
+    # Serve from the cache copy and drop the map output it was copied from
+    intermediate_files = [f["filename"] for f in processed.cache_files]
+    del processed
+    for filename in intermediate_files:
+        try:
+            os.remove(filename)
+        except OSError:
+            pass  # Still memory-mapped elsewhere (Windows); pruned with the next cache
+    return HFDataset.load_from_disk(cache_path)
+
 class MultimodalCollator:
     """
     Custom collator for Qwen3-VL multimodal training.
@@ -181,61 +478,66 @@ class MultimodalCollator:
         self.processor = processor
         self.error_count = 0
         self.success_count = 0
+        self._pool = None
+        # Rendered chat templates keyed by conversation text; persists across epochs
+        self._template_cache = OrderedDict()
     
     def _process_single_sample(self, messages):
-        text, images = extract_text_and_images(messages)
-        
-        if not text:
-            raise ValueError("No text content in sample")
-        if not images:
-            raise ValueError("No images in sample")
-        
-        # Build chat messages for processor
-        chat_messages = []
-        for msg in messages:
-            chat_msg = {"role": msg.get("role", "user"), "content": []}
-            content = msg.get("content", [])
+        return build_model_inputs(messages, self.processor, self._template_cache)
+    
+    def _try_process(self, sample):
+        """
+        Processes one raw sample into CPU tensors.
+        Returns (input_ids, attention_mask, pixel_values, image_grid_thw), or None on failure.
+        """
+        try:
+            processed = self._process_single_sample(sample["messages"])
             
-            for item in content:
-                if isinstance(item, dict):
-                    if item.get("type") == "image":
-                        image_data = item.get("image", "")
-                        if isinstance(image_data, str):
-                            try:
-                                pil_image = base64_to_pil(image_data)
-                                chat_msg["content"].append({"type": "image", "image": pil_image})
-                            except Exception:
-                                pass
-                    elif item.get("type") == "text":
-                        chat_msg["content"].append({"type": "text", "text": item.get("text", "")})
+            input_ids = processed.get("input_ids")
+            attention_mask = processed.get("attention_mask")
+            pixel_values = processed.get("pixel_values")
+            image_grid_thw = processed.get("image_grid_thw")
             
-            if chat_msg["content"]:
-                chat_messages.append(chat_msg)
-        
-        if not chat_messages:
-            raise ValueError("No valid chat messages after processing")
-        
-        text_with_template = self.processor.apply_chat_template(
-            chat_messages,
-            tokenize=False,
-            add_generation_prompt=False,
-        )
-        
-        processed_images = []
-        for msg in chat_messages:
-            for item in msg.get("content", []):
-                if isinstance(item, dict) and item.get("type") == "image":
-                    processed_images.append(item["image"])
-        
-        processed = self.processor(
-            text=text_with_template,
-            images=processed_images if processed_images else None,
-            return_tensors="pt",
-        )
-        
-        return processed
+            if input_ids is None or input_ids.numel() == 0:
+                return None
+            
+            input_ids = input_ids.long().cpu()
+            
+            if attention_mask is not None:
+                attention_mask = attention_mask.long().cpu()
+            else:
+                attention_mask = torch.ones_like(input_ids, dtype=torch.long)
+            
+            if input_ids.shape != attention_mask.shape:
+                attention_mask = torch.ones_like(input_ids, dtype=torch.long)
+            
+            if pixel_values is not None and hasattr(pixel_values, 'cpu'):
+                pixel_values = pixel_values.cpu()
+            
+            return input_ids, attention_mask, pixel_values, image_grid_thw
+        except Exception:
+            return None
+    
+    def _get_pool(self):
+        # Created lazily (and dropped when pickled) so DataLoader workers can copy the collator
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=COLLATOR_MAX_WORKERS)
+        return self._pool
+    
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_pool"] = None
+        return state
     
     def __call__(self, batch):
+        if batch and "input_ids" in batch[0]:
+            # Rows from preprocess_dataset: tensors are ready, only pad and stack
+            self.success_count += len(batch)
+            return self._pad_and_stack({
+                key: [sample[key] for sample in batch]
+                for key in ("input_ids", "attention_mask", "pixel_values", "image_grid_thw")
+            })
+
         processed_batch = {
             "input_ids": [],
             "pixel_values": [],
@@ -244,49 +546,31 @@ class MultimodalCollator:
         }
         
         valid_samples = 0
+        samples = [sample for sample in batch if sample.get("messages")]
+        
+        # PIL decoding and the processor release the GIL, so samples can be processed in parallel
+        if len(samples) > 1:
+            results = list(self._get_pool().map(self._try_process, samples))
+        else:
+            results = [self._try_process(sample) for sample in samples]
         
-        for idx, sample in enumerate(batch):
-            messages = sample.get("messages", [])
-            if not messages:
+        for result in results:
+            if result is None:
+                self.error_count += 1
                 continue
             
-            try:
-                processed = self._process_single_sample(messages)
-                
-                input_ids = processed.get("input_ids")
-                attention_mask = processed.get("attention_mask")
-                pixel_values = processed.get("pixel_values")
-                image_grid_thw = processed.get("image_grid_thw")
-                
-                if input_ids is None or input_ids.numel() == 0:
-                    continue
-                
-                input_ids = input_ids.long().cpu()
-                
-                if attention_mask is not None:
-                    attention_mask = attention_mask.long().cpu()
-                else:
-                    attention_mask = torch.ones_like(input_ids, dtype=torch.long)
-                
-                if input_ids.shape != attention_mask.shape:
-                    attention_mask = torch.ones_like(input_ids, dtype=torch.long)
-                
-                processed_batch["input_ids"].append(input_ids)
-                processed_batch["attention_mask"].append(attention_mask)
-                
-                if pixel_values is not None:
-                    pixel_values = pixel_values.cpu() if hasattr(pixel_values, 'cpu') else pixel_values
-                    processed_batch["pixel_values"].append(pixel_values)
-                
-                if image_grid_thw is not None:
-                    processed_batch["image_grid_thw"].append(image_grid_thw)
-                
-                valid_samples += 1
-                self.success_count += 1
+            input_ids, attention_mask, pixel_values, image_grid_thw = result
+            processed_batch["input_ids"].append(input_ids)
+            processed_batch["attention_mask"].append(attention_mask)
             
-            except Exception as e:
-                self.error_count += 1
-                continue
+            if pixel_values is not None:
+                processed_batch["pixel_values"].append(pixel_values)
+            
+            if image_grid_thw is not None:
+                processed_batch["image_grid_thw"].append(image_grid_thw)
+            
+            valid_samples += 1
+            self.success_count += 1
         
         if valid_samples == 0:
             return {
@@ -295,33 +579,27 @@ class MultimodalCollator:
                 "labels": torch.tensor([[0]], dtype=torch.long),
             }
         
+        return self._pad_and_stack(processed_batch)
+    
+    def _pad_and_stack(self, processed_batch):
+        """Pads token sequences to the batch max length and concatenates vision inputs."""
         final_batch = {}
         
         if processed_batch["input_ids"]:
-            max_len = max(ids.shape[-1] for ids in processed_batch["input_ids"])
-            padded_ids = []
-            padded_masks = []
-            
-            for ids, mask in zip(processed_batch["input_ids"], processed_batch["attention_mask"]):
-                if ids.dim() == 1: ids = ids.unsqueeze(0)
-                if mask.dim() == 1: mask = mask.unsqueeze(0)
-                
-                pad_len = max_len - ids.shape[-1]
-                if pad_len > 0:
-                    ids = torch.cat([ids, torch.full((ids.shape[0], pad_len), 0, dtype=torch.long)], dim=-1)
-                    mask = torch.cat([mask, torch.zeros((mask.shape[0], pad_len), dtype=torch.long)], dim=-1)
-                
-                padded_ids.append(ids)
-                padded_masks.append(mask)
+            input_ids = pad_sequence(
+                [ids.view(-1) for ids in processed_batch["input_ids"]], batch_first=True, padding_value=0
+            )
+            attention_mask = pad_sequence(
+                [mask.view(-1) for mask in processed_batch["attention_mask"]], batch_first=True, padding_value=0
+            )
             
-            final_batch["input_ids"] = torch.cat(padded_ids, dim=0).long()
-            final_batch["attention_mask"] = torch.cat(padded_masks, dim=0).long()
-            final_batch["labels"] = final_batch["input_ids"].clone()
-            final_batch["labels"][final_batch["attention_mask"] == 0] = -100
+            final_batch["input_ids"] = _pin(input_ids)
+            final_batch["attention_mask"] = _pin(attention_mask)
+            final_batch["labels"] = _pin(input_ids.masked_fill(attention_mask == 0, -100))
 
         if processed_batch["pixel_values"]:
             try:
-                final_batch["pixel_values"] = torch.cat(processed_batch["pixel_values"], dim=0)
+                final_batch["pixel_values"] = _pin(torch.cat(processed_batch["pixel_values"], dim=0))
             except Exception:
                 if processed_batch["pixel_values"]:
                     final_batch["pixel_values"] = processed_batch["pixel_values"][0]
@@ -338,4 +616,4 @@ class MultimodalCollator:
             except Exception:
                 pass
         
-        return final_batch
\ No newline at end of file
+        return final_batch
@@ -5,11 +5,13 @@ from transformers import (
     Qwen3VLForConditionalGeneration, 
     BitsAndBytesConfig
 )
+from transformers.utils import is_flash_attn_2_available
 from peft import (
     get_peft_model, 
     LoraConfig, 
     prepare_model_for_kbit_training
 )
+from engine.config import get_compute_dtype
 
 # Define local cache directory for models to keep project self-contained
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -37,18 +39,27 @@ def load_model_and_processor(base_model_id: str, peft_config: LoraConfig):
     
     print(f"[Engine] Loading Model (NF4 Quantization) for: {base_model_id}")
     
-    # Modern Quantization Config
+    # Modern Quantization Config (bf16 compute on Ampere+, matching the trainer's precision)
+    compute_dtype = get_compute_dtype()
     bnb_config = BitsAndBytesConfig(
         load_in_4bit=True,
         bnb_4bit_quant_type="nf4",
-        bnb_4bit_compute_dtype=torch.float16,
+        bnb_4bit_compute_dtype=compute_dtype,
         bnb_4bit_use_double_quant=True,
     )
 
+    # Fused attention kernels: FlashAttention-2 needs Ampere+, which is exactly when we
+    # compute in bf16; older GPUs (fp16) and installs without flash-attn use PyTorch SDPA
+    use_flash_attn = compute_dtype == torch.bfloat16 and is_flash_attn_2_available()
+    attn_implementation = "flash_attention_2" if use_flash_attn else "sdpa"
+    print(f"[Engine] Compute dtype: {compute_dtype}, attention: {attn_implementation}")
+
     model = Qwen3VLForConditionalGeneration.from_pretrained(
         base_model_id,
         device_map="auto",
         quantization_config=bnb_config,
+        dtype=compute_dtype,
+        attn_implementation=attn_implementation,
         trust_remote_code=True,
         cache_dir=MODEL_CACHE_DIR,
     )
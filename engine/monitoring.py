@@ -1,20 +1,43 @@
+import os
 import logging
 import atexit
+import threading
 import time
+from functools import lru_cache
+from operator import itemgetter
 from transformers import TrainerCallback
 
-# Configure logger
-logging.basicConfig(level=logging.INFO)
+# Module logger; handlers and levels are configured by the application entry point
 logger = logging.getLogger("HardwareMonitor")
 
 # Try to import pynvml; handle the case where it's missing entirely
 try:
     import pynvml
     PYNVML_INSTALLED = True
+    # Human-readable messages for the NVML failures users commonly hit, keyed by error code.
+    # Looked up by name because older nvidia-ml-py releases lack some constants.
+    NVML_ERROR_MESSAGES = {
+        getattr(pynvml, name): message
+        for name, message in (
+            ("NVML_ERROR_LIBRARY_NOT_FOUND", "NVIDIA Driver Not Found"),
+            ("NVML_ERROR_DRIVER_NOT_LOADED", "NVIDIA Driver Not Loaded"),
+            ("NVML_ERROR_GPU_NOT_FOUND", "No NVIDIA GPU Detected"),
+        )
+        if hasattr(pynvml, name)
+    }
 except ImportError:
     PYNVML_INSTALLED = False
+    NVML_ERROR_MESSAGES = {}
     logger.error("❌ pynvml not installed. Hardware monitoring will be disabled.")
 
+# Seconds between background telemetry samples; every request reuses the latest one.
+# NVML refreshes utilization/power every ~20-100 ms, so faster sampling only repeats readings.
+SAMPLE_INTERVAL = max(0.1, float(os.getenv("GPU_POLL_INTERVAL_MS", "1000")) / 1000)
+
+# Which metrics each sample queries: 1 = utilization, 2 = + VRAM, 3 = + temperature.
+# Lower levels skip NVML calls (temperature is slow on some drivers); skipped metrics are None.
+TELEMETRY_LEVEL = min(3, max(1, int(os.getenv("GPU_TELEMETRY_LEVEL", "3"))))
+
 class HardwareMonitor:
     """
     Singleton class to manage NVIDIA GPU telemetry via NVML.
@@ -25,6 +48,13 @@ class HardwareMonitor:
         self.handle = None
         self.error_msg = None
         self.device_index = 0  # Default to primary GPU
+        # Static device properties, resolved once at init
+        self.name = None
+        self.total_vram = None
+        # Last telemetry sample, refreshed by the background sampler thread
+        self.snapshot = None
+        self._stop_event = threading.Event()
+        self._sampler = None
         
         # Attempt initialization immediately upon instantiation
         self._initialize_nvml()
@@ -41,12 +71,16 @@ class HardwareMonitor:
             pynvml.nvmlInit()
             # Get handle for the first GPU
             self.handle = pynvml.nvmlDeviceGetHandleByIndex(self.device_index)
-            self.available = True
-            
-            # Log success with device name
+
+            # Name and total VRAM never change for a handle; cache them for get_telemetry
             name = pynvml.nvmlDeviceGetName(self.handle)
             if isinstance(name, bytes):
                 name = name.decode("utf-8")
+            self.name = name
+            self.total_vram = pynvml.nvmlDeviceGetMemoryInfo(self.handle).total
+            self.available = True
+            
+            # Log success with device name
             logger.info(f"✅ NVML Initialized. Monitoring GPU: {name}")
             
         except pynvml.NVMLError as e:
@@ -60,14 +94,7 @@ class HardwareMonitor:
 
     def _format_nvml_error(self, err):
         """Helper to make NVML errors human-readable."""
-        msg = str(err)
-        if "LibraryNotFound" in msg:
-            return "NVIDIA Driver Not Found"
-        if "DriverNotLoaded" in msg:
-            return "NVIDIA Driver Not Loaded"
-        if "NoDevice" in msg:
-            return "No NVIDIA GPU Detected"
-        return msg
+        return NVML_ERROR_MESSAGES.get(getattr(err, "value", None), str(err))
 
     def get_telemetry(self):
         """
@@ -81,25 +108,24 @@ class HardwareMonitor:
             }
 
         try:
-            name = pynvml.nvmlDeviceGetName(self.handle)
-            if isinstance(name, bytes):
-                name = name.decode("utf-8")
-
             util_rates = pynvml.nvmlDeviceGetUtilizationRates(self.handle)
             gpu_load = util_rates.gpu
 
-            mem_info = pynvml.nvmlDeviceGetMemoryInfo(self.handle)
-            vram_used_gb = round(mem_info.used / (1024**3), 1)
-            vram_total_gb = round(mem_info.total / (1024**3), 1)
+            # VRAM is reported in raw bytes; the UI converts to GB for display
+            vram_used = None
+            if TELEMETRY_LEVEL >= 2:
+                vram_used = pynvml.nvmlDeviceGetMemoryInfo(self.handle).used
 
-            temp = pynvml.nvmlDeviceGetTemperature(self.handle, pynvml.NVML_TEMPERATURE_GPU)
+            temp = None
+            if TELEMETRY_LEVEL >= 3:
+                temp = pynvml.nvmlDeviceGetTemperature(self.handle, pynvml.NVML_TEMPERATURE_GPU)
 
             return {
                 "available": True,
-                "gpu_name": name,
+                "gpu_name": self.name,
                 "utilization": gpu_load,
-                "vram_used": vram_used_gb,
-                "vram_total": vram_total_gb,
+                "vram_used": vram_used,
+                "vram_total": self.total_vram,
                 "temp": temp
             }
         except pynvml.NVMLError as e:
@@ -110,8 +136,28 @@ class HardwareMonitor:
                 "error": self.error_msg
             }
 
+    def start_sampler(self, interval=SAMPLE_INTERVAL):
+        """
+        Starts a daemon thread that refreshes self.snapshot every `interval` seconds,
+        so the NVML query rate is independent of how often the UI asks for telemetry.
+        """
+        self.snapshot = self.get_telemetry()
+        if not self.available or self._sampler is not None:
+            return
+        self._sampler = threading.Thread(target=self._sample_loop, args=(interval,), daemon=True)
+        self._sampler.start()
+
+    def _sample_loop(self, interval):
+        while not self._stop_event.wait(interval):
+            self.snapshot = self.get_telemetry()
+            if not self.available:
+                break
+
     def shutdown(self):
-        """Cleanly releases NVML resources."""
+        """Stops the sampler thread and cleanly releases NVML resources."""
+        self._stop_event.set()
+        if self._sampler is not None:
+            self._sampler.join(timeout=SAMPLE_INTERVAL * 2)
         if self.available and PYNVML_INSTALLED:
             try:
                 pynvml.nvmlShutdown()
@@ -119,19 +165,34 @@ class HardwareMonitor:
                 pass
             self.available = False
 
-monitor = HardwareMonitor()
-atexit.register(monitor.shutdown)
+# Created on first use so importing this module (e.g. for the callback) never touches NVML
+_monitor = None
+_monitor_lock = threading.Lock()
+
+def _get_monitor():
+    """Returns the process-wide HardwareMonitor, starting NVML and the sampler on first call."""
+    global _monitor
+    if _monitor is None:
+        with _monitor_lock:
+            if _monitor is None:
+                monitor = HardwareMonitor()
+                monitor.start_sampler()
+                atexit.register(monitor.shutdown)
+                _monitor = monitor
+    return _monitor
 
 def get_hardware_status():
-    """Public interface for the API route."""
-    return monitor.get_telemetry()
+    """Public interface for the API route. Returns the latest background sample."""
+    return _get_monitor().snapshot
 
 def _format_time(seconds):
     """Formats seconds into HH:MM:SS or MM:SS."""
     if seconds is None:
         return "--:--"
-    
-    s = int(seconds)
+    return _format_whole_seconds(int(seconds))
+
+@lru_cache(maxsize=4096)
+def _format_whole_seconds(s):
     h, remainder = divmod(s, 3600)
     m, s = divmod(remainder, 60)
     
@@ -140,64 +201,87 @@ def _format_time(seconds):
     else:
         return f"{m:02d}:{s:02d}"
 
+# Pulls the per-step metrics out of a trainer log dict in one C-level call
+_STEP_METRICS = itemgetter("loss", "learning_rate")
+
 class EnhancedStateCallback(TrainerCallback):
     """
     Callback to update the global app state dictionary during training.
     """
-    def __init__(self, app_state, total_steps):
+    def __init__(self, app_state, total_steps, on_state_change=None, stop_event=None):
         self.app_state = app_state
         self.total_steps = total_steps
+        self.on_state_change = on_state_change
+        self.stop_event = stop_event
+        # Percent per step, so progress is a single multiply per log
+        self._progress_scale = 100.0 / total_steps if total_steps > 0 else 0.0
+        # Last step whose progress/ETR was computed; summary and eval logs repeat it
+        self._last_step = -1
+        # Monotonic reference for ETR, immune to wall-clock (NTP) adjustments
+        self._train_start = None
+
+    def on_train_begin(self, args, state, control, **kwargs):
+        self._train_start = time.monotonic()
+
+    def on_step_end(self, args, state, control, **kwargs):
+        # Ends the loop after the current step; the trainer still saves the adapter
+        if self.stop_event is not None and self.stop_event.is_set():
+            control.should_training_stop = True
 
     def on_log(self, args, state, control, logs=None, **kwargs):
-        if not logs or self.app_state["status"] != "TRAINING":
+        if not logs or self.app_state.get("status") != "TRAINING":
             return
 
         # --- Metrics Logging to UI ---
         log_line = ""
-        # Case 1: Standard training step log
-        if "loss" in logs and "learning_rate" in logs:
-            step = state.global_step
-            total = self.total_steps
-            
-            loss_val = f"loss={logs['loss']:.4f}"
-            lr_val = f"lr={logs['learning_rate']:.2e}"
-            grad_norm_val = f"grad_norm={logs.get('grad_norm', 0.0):.2f}"
-            
-            token_acc_val = ""
+        # Case 1: Standard training step log (the common case; summary/eval logs take the KeyError path)
+        try:
+            loss, lr = _STEP_METRICS(logs)
+            is_step_log = True
+        except KeyError:
+            is_step_log = False
+
+        if is_step_log:
+            token_acc = ""
             if 'mean_token_accuracy' in logs:
-                acc = logs['mean_token_accuracy'] * 100
-                token_acc_val = f", token_acc={acc:.2f}%"
+                token_acc = f", token_acc={logs['mean_token_accuracy'] * 100:.2f}%"
 
-            log_line = f"Step {step}/{total}: {loss_val}, {grad_norm_val}, {lr_val}{token_acc_val}"
+            log_line = (
+                f"Step {state.global_step}/{self.total_steps}: loss={loss:.4f}, "
+                f"grad_norm={logs.get('grad_norm', 0.0):.2f}, lr={lr:.2e}{token_acc}"
+            )
 
         # Case 2: Final training summary log
         elif "train_loss" in logs and "train_runtime" in logs:
-            final_loss = f"final_loss={logs['train_loss']:.4f}"
-            runtime = f"runtime={_format_time(logs['train_runtime'])}"
-            log_line = f"Training Complete: {final_loss}, {runtime}"
+            log_line = (
+                f"Training Complete: final_loss={logs['train_loss']:.4f}, "
+                f"runtime={_format_time(logs['train_runtime'])}"
+            )
         
         if log_line:
+            # Bounded deque owned by the app; eviction is automatic
             self.app_state["logs"].append(log_line)
-            # Keep buffer small to prevent memory leaks
-            if len(self.app_state["logs"]) > 100:
-                self.app_state["logs"].pop(0)
         
         # --- State Updates (Progress, Timers) ---
-        if "loss" in logs:
-            self.app_state["current_loss"] = round(logs["loss"], 4)
-        if self.total_steps > 0:
-            progress = (state.global_step / self.total_steps) * 100
-            self.app_state["progress"] = round(progress, 1)
-
-        start_time = self.app_state.get("start_time")
-        if start_time:
-            # NOTE: Live elapsed duration is now handled client-side in JS
-            # We only calculate ETR here.
-            elapsed_seconds = time.time() - start_time
-            if state.global_step > 0:
-                time_per_step = elapsed_seconds / state.global_step
-                remaining_steps = self.total_steps - state.global_step
-                etr_seconds = remaining_steps * time_per_step
-                self.app_state["etr"] = _format_time(etr_seconds)
-            else:
-                self.app_state["etr"] = "--:--"
\ No newline at end of file
+        # Only per-step loss logs advance progress; skip repeats of the same step
+        if "loss" in logs and state.global_step != self._last_step:
+            self._last_step = state.global_step
+            # Raw floats; the UI does the display formatting
+            self.app_state["current_loss"] = logs["loss"]
+            if self.total_steps > 0:
+                self.app_state["progress"] = state.global_step * self._progress_scale
+
+            if self._train_start is not None:
+                # NOTE: Live elapsed duration is now handled client-side in JS
+                # We only calculate ETR here.
+                elapsed_seconds = time.monotonic() - self._train_start
+                if state.global_step > 0:
+                    time_per_step = elapsed_seconds / state.global_step
+                    remaining_steps = self.total_steps - state.global_step
+                    etr_seconds = remaining_steps * time_per_step
+                    self.app_state["etr"] = _format_time(etr_seconds)
+                else:
+                    self.app_state["etr"] = "--:--"
+
+        if self.on_state_change:
+            self.on_state_change()
\ No newline at end of file
@@ -1,11 +1,23 @@
 import os
-import shutil
 import time
-import json
+import zipfile
 import traceback
+import orjson
 from trl import SFTTrainer
 from engine import config, data, model, monitoring
 
+# Tensor weights barely deflate; store them as-is and only compress config/tokenizer files
+STORED_SUFFIXES = (".safetensors", ".bin", ".pt")
+
+def package_adapter(src_dir: str, zip_path: str):
+    """Zips an adapter directory, skipping compression for the weight files."""
+    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for root, _, files in os.walk(src_dir):
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                compress_type = zipfile.ZIP_STORED if name.endswith(STORED_SUFFIXES) else zipfile.ZIP_DEFLATED
+                zf.write(path, os.path.relpath(path, src_dir), compress_type=compress_type)
+
 class LoraTrainer:
     """
     Orchestrator class for the LoRA training pipeline.
@@ -24,6 +36,8 @@ class LoraTrainer:
         state_ref: dict,
         use_thinking: bool = False,
         temp_folder: str = "temp",
+        on_state_change=None,
+        stop_event=None,
     ):
         self.base_model_id = base_model
         self.dataset_folder_train = dataset_folder_train
@@ -35,14 +49,24 @@ class LoraTrainer:
         self.state = state_ref
         self.use_thinking = use_thinking
         self.temp_folder = temp_folder
+        # Optional hook invoked after state updates (used to wake /events streams)
+        self.on_state_change = on_state_change
+        # Event set by the app to request a graceful stop between optimizer steps
+        self.stop_event = stop_event
 
     def log(self, msg: str):
         """Helper to append logs to the global state safely."""
         print(f"[Trainer] {msg}")
+        # The app owns a bounded deque, so appends never grow unbounded
         self.state["logs"].append(msg)
-        # Keep buffer small to prevent memory leaks in long runs
-        if len(self.state["logs"]) > 100:
-            self.state["logs"].pop(0)
+        if self.on_state_change:
+            self.on_state_change()
+
+    def _stop_requested(self) -> bool:
+        """Reads the stop event directly; the state flag is only mirrored from it asynchronously."""
+        if self.stop_event is not None:
+            return self.stop_event.is_set()
+        return self.state.get("stop_signal", False)
 
     def run(self):
         """
@@ -59,19 +83,27 @@ class LoraTrainer:
             self.log(f"Model loaded: {self.base_model_id}")
 
             # 2. Prepare Datasets
+            # Images are decoded and tokenized once (not every epoch in the collator),
+            # and the result is reused by later runs while the files are unchanged.
             self.log("Loading training dataset...")
-            train_dataset = data.load_and_prepare_dataset(
+            train_dataset = data.load_preprocessed_dataset(
                 self.dataset_folder_train, 
+                processor,
+                cache_folder=self.temp_folder,
                 allow_empty=False, 
                 use_thinking=self.use_thinking
             )
             num_train = len(train_dataset)
+            if num_train == 0:
+                raise RuntimeError("No training samples could be processed (check text/image content).")
             self.log(f"Training set ready: {num_train} samples.")
 
             self.log("Loading validation dataset...")
             # We allow empty validation set, but warn the user
-            eval_dataset = data.load_and_prepare_dataset(
+            eval_dataset = data.load_preprocessed_dataset(
                 self.dataset_folder_val, 
+                processor,
+                cache_folder=self.temp_folder,
                 allow_empty=True, 
                 use_thinking=self.use_thinking
             )
@@ -79,6 +111,7 @@ class LoraTrainer:
                 self.log(f"Validation set ready: {len(eval_dataset)} samples.")
             else:
                 self.log("⚠️ No validation data found. Skipping evaluation phase.")
+                eval_dataset = None
 
             # 3. Configure Training
             run_name = f"lora_{int(time.time())}"
@@ -89,6 +122,8 @@ class LoraTrainer:
                 epochs=self.epochs,
                 learning_rate=self.lr
             )
+            # Run directory for validation results and the final adapter
+            output_dir = training_args.output_dir
 
             # Calculate total steps for progress tracking
             steps_per_epoch = max(num_train // max(self.batch_size, 1), 1)
@@ -103,14 +138,16 @@ class LoraTrainer:
                 train_dataset=train_dataset,
                 eval_dataset=eval_dataset,
                 data_collator=data.MultimodalCollator(processor),
-                callbacks=[monitoring.EnhancedStateCallback(self.state, total_steps)],
+                callbacks=[monitoring.EnhancedStateCallback(
+                    self.state, total_steps, self.on_state_change, self.stop_event
+                )],
             )
 
             # 5. Execute Training
             trainer.train()
             
             # Check if stopped manually
-            if self.state.get("stop_signal", False):
+            if self._stop_requested():
                 self.log("⚠️ Training was manually interrupted by user.")
                 self.state["status"] = "INTERRUPTED"
             else:
@@ -119,7 +156,7 @@ class LoraTrainer:
                 self.state["progress"] = 100.0
 
             # 6. Execute Validation (if dataset exists and not interrupted)
-            if eval_dataset and not self.state.get("stop_signal", False):
+            if eval_dataset and not self._stop_requested():
                 self.log("Running final validation...")
                 try:
                     metrics = trainer.evaluate()
@@ -129,33 +166,30 @@ class LoraTrainer:
                     self.state["val_metrics"] = metrics
                     
                     # Save metrics to disk
-                    metrics_path = os.path.join(training_args.output_dir, "validation_results.json")
-                    with open(metrics_path, "w") as f:
-                        json.dump(metrics, f, indent=2)
+                    metrics_path = os.path.join(output_dir, "validation_results.json")
+                    with open(metrics_path, "wb") as f:
+                        f.write(orjson.dumps(metrics, option=orjson.OPT_INDENT_2))
                     
-                    # Create human-readable log
-                    txt_path = os.path.join(training_args.output_dir, "validation_log.txt")
+                    # Create human-readable log (built in memory, written once)
+                    txt_path = os.path.join(output_dir, "validation_log.txt")
+                    lines = "".join(f"{k}: {v}\n" for k, v in metrics.items())
                     with open(txt_path, "w") as f:
-                        f.write("VALIDATION RESULTS\n==================\n")
-                        for k, v in metrics.items():
-                            f.write(f"{k}: {v}\n")
+                        f.write("VALIDATION RESULTS\n==================\n" + lines)
                             
                 except Exception as e:
                     self.log(f"Error during validation: {e}")
 
             # 7. Save Artifacts (Even if interrupted)
             self.log("Saving adapter and processor...")
-            final_path = os.path.join(training_args.output_dir, "final_adapter")
-            os.makedirs(final_path, exist_ok=True)
-            
+            final_path = os.path.join(output_dir, "final_adapter")
+            # save_pretrained creates final_path itself
             trainer.model.save_pretrained(final_path)
             processor.save_pretrained(final_path)
 
             # 8. Package Output
             self.log("Creating ZIP package...")
-            zip_base = os.path.join(self.output_folder, run_name)
-            shutil.make_archive(zip_base, "zip", final_path)
-            zip_path = zip_base + ".zip"
+            zip_path = os.path.join(self.output_folder, f"{run_name}.zip")
+            package_adapter(final_path, zip_path)
 
             # 9. Update Final State
             self.state["output_zip"] = zip_path
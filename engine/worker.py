@@ -0,0 +1,126 @@
+import queue
+import multiprocessing as mp
+import threading
+
+# CUDA cannot be re-initialized in a forked child, so the trainer process is spawned
+_MP_CONTEXT = mp.get_context("spawn")
+
+# Seconds the parent waits on the update queue before re-checking the child is alive
+PUMP_TIMEOUT = 0.5
+
+class _LogOutbox:
+    """Stands in for the log buffer in the child; collects lines until the next publish."""
+    def __init__(self):
+        self.pending = []
+
+    def append(self, line):
+        self.pending.append(line)
+
+def _run_trainer(trainer_kwargs, initial_state, updates, stop_event):
+    """
+    Subprocess entrypoint. Runs LoraTrainer against a process-local state dict and
+    publishes new log lines and changed keys to the parent through `updates`.
+    """
+    # Imported here so the parent process never pays for the training stack import
+    from engine.trainer import LoraTrainer
+
+    state = dict(initial_state, logs=_LogOutbox())
+    published = dict(initial_state)
+
+    def publish():
+        lines, state["logs"].pending = state["logs"].pending, []
+        changes = {k: v for k, v in state.items() if k != "logs" and published.get(k) != v}
+        published.update(changes)
+        if lines:
+            updates.put(("logs", lines))
+        if changes:
+            updates.put(("state", changes))
+
+    def watch_stop():
+        stop_event.wait()
+        state["stop_signal"] = True
+
+    threading.Thread(target=watch_stop, daemon=True).start()
+
+    trainer = LoraTrainer(**trainer_kwargs, state_ref=state, on_state_change=publish, stop_event=stop_event)
+    try:
+        trainer.run()
+    finally:
+        publish()
+
+class TrainingProcess:
+    """
+    Runs a LoraTrainer in a separate process so its Python-side work (callbacks,
+    dataset preparation) never contends with the web server for the GIL.
+
+    The parent keeps the authoritative `state` dict: updates from the child are
+    applied under `state_lock`, and `on_update` is called after each batch.
+    `owns_state` is checked under the lock before applying; once it returns False
+    (a newer run took over the state), late updates from this child are dropped.
+    """
+    def __init__(self, trainer_kwargs: dict, state: dict, state_lock, on_update=None, owns_state=None):
+        self.trainer_kwargs = trainer_kwargs
+        self.state = state
+        self.state_lock = state_lock
+        self.on_update = on_update
+        self.owns_state = owns_state or (lambda: True)
+        self.updates = _MP_CONTEXT.Queue()
+        self.stop_event = _MP_CONTEXT.Event()
+        self.process = None
+
+    def start(self):
+        with self.state_lock:
+            initial_state = {k: v for k, v in self.state.items() if k != "logs"}
+        self.process = _MP_CONTEXT.Process(
+            target=_run_trainer,
+            args=(self.trainer_kwargs, initial_state, self.updates, self.stop_event),
+            daemon=False,
+        )
+        self.process.start()
+
+    def is_alive(self):
+        """True from start() until the subprocess has exited."""
+        return self.process is not None and self.process.is_alive()
+
+    def request_stop(self):
+        """Asks the trainer to stop gracefully (partial progress is still saved)."""
+        self.stop_event.set()
+
+    def terminate(self):
+        """Kills the trainer outright, e.g. when it is stuck inside a native kernel."""
+        if self.process is not None and self.process.is_alive():
+            self.process.terminate()
+
+    def wait(self):
+        """Mirrors child updates into the state until the subprocess exits. Returns its exit code."""
+        while True:
+            try:
+                kind, payload = self.updates.get(timeout=PUMP_TIMEOUT)
+            except queue.Empty:
+                if not self.process.is_alive():
+                    break
+                continue
+            self._apply(kind, payload)
+
+        # Drain anything the child flushed right before exiting
+        while True:
+            try:
+                kind, payload = self.updates.get_nowait()
+            except queue.Empty:
+                break
+            self._apply(kind, payload)
+
+        self.process.join()
+        return self.process.exitcode
+
+    def _apply(self, kind, payload):
+        with self.state_lock:
+            if not self.owns_state():
+                return
+            if kind == "logs":
+                for line in payload:
+                    self.state["logs"].append(line)
+            else:
+                self.state.update(payload)
+        if self.on_update:
+            self.on_update()
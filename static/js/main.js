@@ -31,9 +31,13 @@ const els = {
     metricsBody: document.getElementById('metricsBody')
 };
 
-let pollInterval = null;
+const MAX_LOG_LINES = 200; // Matches the server-side STATUS_LOG_TAIL
+const BYTES_PER_GB = 1024 ** 3;
+
+let eventSource = null;
+let timerInterval = null;
 let trainFileCount = 0;
-let trainingStartTime = null; // Stores Unix timestamp for live timer
+let liveState = {}; // Training state merged from /events deltas
 
 // --- Helper to format time ---
 function formatTime(seconds) {
@@ -116,7 +120,7 @@ async function handleUpload(files, type, listElement) {
     }
     
     try {
-        const res = await fetch('/upload', { method: 'POST', body: formData });
+        const res = await fetch(`/upload?type=${type}`, { method: 'POST', body: formData });
         const data = await res.json();
         
         // 2. State Sync: Re-render list with authoritative server data
@@ -177,8 +181,7 @@ els.startBtn.onclick = async () => {
         els.activeControls.classList.remove('hidden');
         els.completionActions.classList.add('hidden');
         els.validationResults.classList.add('hidden');
-        trainingStartTime = null; // Reset timer state
-        startPolling();
+        startEventStream();
     }
 };
 
@@ -188,54 +191,71 @@ els.stopBtn.onclick = async () => {
     await fetch('/stop', { method: 'POST' });
 };
 
-function startPolling() {
-    pollInterval = setInterval(async () => {
-        try {
-            const res = await fetch('/status');
-            const state = await res.json();
+function startEventStream() {
+    liveState = {};
+    eventSource = new EventSource('/events');
 
-            // Live Timer Logic
-            if (state.status === 'TRAINING' && state.start_time) {
-                if (!trainingStartTime) {
-                    trainingStartTime = state.start_time;
-                }
-                const now = new Date().getTime() / 1000;
-                const elapsed = now - trainingStartTime;
-                els.monitorTimer.textContent = formatTime(elapsed);
-            } else {
-                els.monitorTimer.textContent = state.duration;
-            }
+    eventSource.onmessage = (e) => {
+        const delta = JSON.parse(e.data);
+
+        if (delta.logs_reset) els.terminal.innerHTML = '';
+        if (delta.logs && delta.logs.length) appendLogs(delta.logs);
+        if (delta.hardware) updateHardwareUI(delta.hardware);
+        if (delta.state) {
+            Object.assign(liveState, delta.state);
+            renderTrainingState(liveState);
+        }
+    };
+    eventSource.onerror = (err) => console.error("Event stream error:", err);
 
-            // Update UI from state
-            els.monitorStatus.textContent = state.status;
-            els.monitorETR.textContent = state.etr || "--:--";
-            els.monitorPercent.textContent = state.progress + '%';
-            els.progressBar.style.width = state.progress + '%';
-            els.terminal.innerHTML = state.logs.map(l => `<div class="log-line">${l}</div>`).join('');
-            els.terminal.scrollTop = els.terminal.scrollHeight;
+    // Live elapsed timer ticks client-side; the server only pushes changes
+    timerInterval = setInterval(updateTimer, 1000);
+}
 
-            // Handle end-of-training states
-            if (['FINISHED', 'INTERRUPTED', 'ERROR'].includes(state.status)) {
-                clearInterval(pollInterval);
-                trainingStartTime = null;
-                els.monitorStatus.style.color = state.status === 'FINISHED' ? 'var(--success)' : (state.status === 'ERROR' ? '#ef4444' : '#f59e0b');
-                els.activeControls.classList.add('hidden');
-                if (state.status !== 'ERROR') {
-                    els.completionActions.classList.remove('hidden');
-                    if (state.val_metrics) renderMetrics(state.val_metrics);
-                } else {
-                    alert("Error: " + state.error_msg);
-                }
-            }
+function stopEventStream() {
+    if (eventSource) eventSource.close();
+    clearInterval(timerInterval);
+    eventSource = null;
+}
 
-            const hwRes = await fetch('/hardware-status');
-            const hw = await hwRes.json();
-            updateHardwareUI(hw);
+function appendLogs(lines) {
+    els.terminal.insertAdjacentHTML('beforeend', lines.map(l => `<div class="log-line">${l}</div>`).join(''));
+    while (els.terminal.childElementCount > MAX_LOG_LINES) {
+        els.terminal.removeChild(els.terminal.firstChild);
+    }
+    els.terminal.scrollTop = els.terminal.scrollHeight;
+}
+
+function updateTimer() {
+    if (liveState.status === 'TRAINING' && liveState.start_time) {
+        const now = new Date().getTime() / 1000;
+        els.monitorTimer.textContent = formatTime(now - liveState.start_time);
+    } else if (liveState.duration) {
+        els.monitorTimer.textContent = liveState.duration;
+    }
+}
+
+function renderTrainingState(state) {
+    updateTimer();
+    els.monitorStatus.textContent = state.status;
+    els.monitorETR.textContent = state.etr || "--:--";
+    // Progress arrives unrounded; Number() drops trailing zeros ("50%", "33.3%")
+    const percent = Number(state.progress.toFixed(1)) + '%';
+    els.monitorPercent.textContent = percent;
+    els.progressBar.style.width = percent;
 
-        } catch (err) {
-            console.error("Polling error:", err);
+    // Handle end-of-training states
+    if (['FINISHED', 'INTERRUPTED', 'ERROR'].includes(state.status)) {
+        stopEventStream();
+        els.monitorStatus.style.color = state.status === 'FINISHED' ? 'var(--success)' : (state.status === 'ERROR' ? '#ef4444' : '#f59e0b');
+        els.activeControls.classList.add('hidden');
+        if (state.status !== 'ERROR') {
+            els.completionActions.classList.remove('hidden');
+            if (state.val_metrics) renderMetrics(state.val_metrics);
+        } else {
+            alert("Error: " + state.error_msg);
         }
-    }, 1000);
+    }
 }
 
 function updateHardwareUI(hw) {
@@ -243,11 +263,18 @@ function updateHardwareUI(hw) {
         els.gpuName.textContent = hw.gpu_name;
         els.gpuUtil.textContent = hw.utilization + '%';
         els.gpuUtilBar.style.width = hw.utilization + '%';
-        els.vramUsage.textContent = `${hw.vram_used} / ${hw.vram_total} GB`;
-        if (hw.vram_total > 0) {
-            els.vramBar.style.width = (hw.vram_used / hw.vram_total) * 100 + '%';
+        // VRAM arrives in bytes; VRAM/temp are null when GPU_TELEMETRY_LEVEL skips them
+        const totalGB = (hw.vram_total / BYTES_PER_GB).toFixed(1);
+        if (hw.vram_used !== null) {
+            const usedGB = (hw.vram_used / BYTES_PER_GB).toFixed(1);
+            els.vramUsage.textContent = `${usedGB} / ${totalGB} GB`;
+            if (hw.vram_total > 0) {
+                els.vramBar.style.width = (hw.vram_used / hw.vram_total) * 100 + '%';
+            }
+        } else {
+            els.vramUsage.textContent = `-- / ${totalGB} GB`;
         }
-        els.gpuTemp.textContent = hw.temp + '°C';
+        els.gpuTemp.textContent = hw.temp !== null ? hw.temp + '°C' : '--';
     } else {
         els.gpuName.textContent = "HARDWARE NOT DETECTED";
         els.gpuUtil.textContent = "ERR";
@@ -0,0 +1,15 @@
+"""
+WSGI entrypoint for production servers, e.g.:
+
+    gunicorn -w 1 --threads 8 --keep-alive 5 -b 0.0.0.0:5001 wsgi:application
+
+Use a single worker: training state lives in the process (TRAINING_STATE),
+so multiple workers would each see a different run. Threads are safe.
+--keep-alive lets the browser reuse its connection between requests.
+"""
+import os
+from app import app, init_ngrok
+
+init_ngrok(int(os.getenv("PORT", "5001")))
+
+application = app